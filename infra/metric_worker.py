@@ -1,15 +1,15 @@
 from __future__ import annotations
 
-import json
 from datetime import datetime
-from time import time
-from typing import Any
+from time import perf_counter, time_ns
+from typing import Any, Iterator
 from multiprocessing import Process, Event
 
 from time import sleep
-import requests
-from requests.exceptions import HTTPError
-from urllib3.exceptions import NewConnectionError
+import orjson
+import urllib3
+from urllib3.exceptions import HTTPError
+from urllib3.util.retry import Retry
 from loguru import logger as log
 import sys
 
@@ -17,6 +17,10 @@ from infra.sqream_connection import SqreamConnection
 
 
 class MetricWorkerProcess(Process):
+    # Max size of values sent in one push. Loki rejects bodies bigger than 4 MB by default
+    # (`grpc_server_max_recv_msg_size`), the rest is left for stream labels
+    _LOKI_MAX_PUSH_BYTES = 3 * 1024 * 1024
+
     def __init__(self,
                  metric_name: str,
                  metric_timeout: int,
@@ -34,12 +38,28 @@ class MetricWorkerProcess(Process):
                  **kwargs):
         self.metric_name = metric_name
         self.metric_timeout = metric_timeout
+        # Query is the same for every cycle, so it's built once
+        self.query = f"select {metric_name}()"
         self.send_to_loki = send_to_loki
         self.loki_url = loki_url
         self.stop_event = stop_event
-        self.sqream_connection: SqreamConnection = SqreamConnection(host=host, port=port, username=username,
-                                                                    password=password, database=database,
-                                                                    clustered=clustered, service=service)
+        # Labels which are the same for every push of this metric (see `build_payload`)
+        self.stream_labels: dict[str, Any] = {"job": metric_name, "response_time": metric_timeout}
+        # Keep-alive pool: every push reuses the same TCP connection to Loki instead of opening a new one.
+        # Worker pushes to the only Loki host, so one pooled connection is enough.
+        # Transient Loki failures (including timeouts) are retried 3 times with exponential backoff
+        # before worker gives up. Without timeout hung Loki would block the worker forever
+        retries = Retry(total=3, backoff_factor=0.2, status_forcelist=(429, 500, 502, 503, 504),
+                        allowed_methods=frozenset({"POST"}), raise_on_status=False)
+        self.loki_pool: urllib3.PoolManager = urllib3.PoolManager(num_pools=1, maxsize=1, retries=retries,
+                                                                  timeout=urllib3.Timeout(connect=2, read=10),
+                                                                  headers={"Content-Type": "application/json"})
+        # Connection is opened in `run`, i.e. in the worker process itself. Sockets opened here (in main process,
+        # before fork) would be shared by both processes and kept open by main process for nothing
+        self.sqream_connection_params: dict[str, Any] = dict(host=host, port=port, username=username,
+                                                             password=password, database=database,
+                                                             clustered=clustered, service=service)
+        self.sqream_connection: SqreamConnection | None = None
         super().__init__(*args, **kwargs)
 
     def run(self):
@@ -55,32 +75,44 @@ class MetricWorkerProcess(Process):
         """
         log.debug(f"[{self.metric_name}]: process with timeout = {self.metric_timeout} sec started successfully")
         try:
+            self.sqream_connection = SqreamConnection(**self.sqream_connection_params)
+            cycle_start = perf_counter()
             while not self.stop_event.is_set():
                 # 1) Get data from sqream
-                data, execution_time = self.sqream_connection.execute(f"select {self.metric_name}()")
+                data, execution_time = self.sqream_connection.execute(self.query)
 
                 # 2) Check if this metric should be sent to Loki
                 if self.send_to_loki:
 
                     if len(data) == 0:
-                        log.warning(f"[{self.metric_name}]: sqream query `select {self.metric_name}();`"
+                        log.warning(f"[{self.metric_name}]: sqream query `{self.query};`"
                                     f" returned 0 rows. Skip sending it to Loki")
                     else:
-                        log.success(f"[{self.metric_name}]: fetched {len(data)} rows from sqream")
+                        log.debug("[{}]: fetched {} rows from sqream", self.metric_name, len(data))
                         # 3) Send data to loki if we need it
                         self.push_logs_to_loki(data=data)
 
                 else:
-                    log.info(f"[{self.metric_name}]: shouldn't be sent to Loki")
+                    log.debug("[{}]: shouldn't be sent to Loki", self.metric_name)
 
                 # 4) Sleep gap nearby timeout (metric frequency)
-                timeout = self.count_metric_timeout(execution_time=execution_time)
-                log.info(f"[{self.metric_name}]: timeout = {timeout} seconds, "
-                         f"because sqream execution time was {execution_time}.")
-                sleep(timeout)
+                # Loki push is blocking, so count it too - otherwise every cycle is longer than metric frequency
+                cycle_time = perf_counter() - cycle_start
+                timeout = self.count_metric_timeout(execution_time=cycle_time)
+                log.debug("[{}]: timeout = {:.2f} seconds, because whole cycle took {:.2f} "
+                          "(sqream execution time was {:.2f}).", self.metric_name, timeout, cycle_time, execution_time)
+                skipped_cycles = self.count_skipped_cycles(cycle_time=cycle_time)
+                if skipped_cycles:
+                    log.warning("[{}]: cycle took {:.2f} seconds which is longer than metric timeout = {} seconds, "
+                                "{} scheduled cycle(s) skipped", self.metric_name, cycle_time, self.metric_timeout,
+                                skipped_cycles)
+                # Next cycle starts at its scheduled time and not when `sleep` returns,
+                # so oversleeping and loop overhead don't accumulate into drift of metric frequency
+                cycle_start += cycle_time + timeout
+                sleep(max(0.0, cycle_start - perf_counter()))
         except KeyboardInterrupt:
             log.info(f"[{self.metric_name}]: Process interrupted by user. Stop all metrics")
-        except (HTTPError, NewConnectionError):
+        except HTTPError:
             log.error(f"[{self.metric_name}]: Connection to loki was lost. Stop all metrics.")
         except ConnectionRefusedError:
             log.error(f"[{self.metric_name}]: Connection to Sqream instance was lost. Stop all metrics")
@@ -89,6 +121,9 @@ class MetricWorkerProcess(Process):
             sys.exit(2)
         finally:
             self.stop_event.set()
+            if self.sqream_connection is not None:
+                self.sqream_connection.close()
+            self.loki_pool.clear()
 
     def push_logs_to_loki(self, data: list[dict[str, str | int]] | dict[str, str | int]) -> None:
         """Function to send post http request to loki
@@ -107,19 +142,58 @@ class MetricWorkerProcess(Process):
         ]
         3) Sometimes data maybe empty list `[]`
 
+        Body bigger than `_LOKI_MAX_PUSH_BYTES` is sent in several requests (see `split_to_batches`)
+
         :return: Nothing, just send post http request
 
         """
-        payload = self.build_payload(data=data)
-        answer = requests.post(self.loki_url, json=payload, allow_redirects=False, verify=True)
-        if answer.status_code == 204:
-            log.success(f"[{self.metric_name}]: Loki successfully accepts {len(data)} rows")
-        else:
-            raise requests.HTTPError(f"[{self.metric_name}]: {answer}. Request was: "
-                                     f"`curl -X POST -H 'Content-Type: application/json' --data-raw "
-                                     f"'{json.dumps(payload)}' {self.loki_url}`")
-
-    def build_payload(self, data: list[dict[str, str | int]] | dict[str, str | int]) -> dict[str, list[dict[str, Any]]]:
+        labels, values = self.build_payload(data=data)
+        body = orjson.dumps({"streams": [{"stream": labels, "values": values}]})
+        # Almost every body fits into one push, so values are measured one by one only if it doesn't
+        if len(body) <= self._LOKI_MAX_PUSH_BYTES:
+            self.post_to_loki(body=body, rows=len(values))
+            return
+        for batch in self.split_to_batches(values):
+            self.post_to_loki(body=orjson.dumps({"streams": [{"stream": labels, "values": batch}]}), rows=len(batch))
+
+    def post_to_loki(self, body: bytes, rows: int) -> None:
+        """Send one encoded push request body to loki
+
+        :param body: json body built from `build_payload` result
+        :param rows: number of rows in body, only for logging
+        :return: Nothing, raises `HTTPError` if Loki didn't accept body
+        """
+        answer = self.loki_pool.request("POST", self.loki_url, body=body, redirect=False)
+        if answer.status != 204:
+            raise HTTPError(f"[{self.metric_name}]: Loki answered {answer.status} {answer.data!r}. Request was: "
+                            f"`curl -X POST -H 'Content-Type: application/json' --data-raw "
+                            f"'{body.decode()}' {self.loki_url}`")
+        log.debug("[{}]: Loki successfully accepts {} rows", self.metric_name, rows)
+
+    def split_to_batches(self, values: list[list[str]]) -> Iterator[list[list[str]]]:
+        """Split stream values (`[timestamp, line]` pairs) into consecutive batches,
+        which JSON-encoded size doesn't exceed `_LOKI_MAX_PUSH_BYTES`.
+        Size is counted on encoded values, so escaped quotes and non-ascii symbols of statement texts are counted too.
+        Value which is bigger than the limit by itself is sent alone
+
+        :param values: `values` of stream built by `build_payload`
+        :return: iterator over lists of values
+        """
+        dumps = orjson.dumps  # bound once - it's called for every value
+        # Encoded batch is `[value,value,...,value]`: every value is followed by comma or `]`, plus one `[`
+        batch_start, batch_bytes = 0, 1
+        for index, value in enumerate(values):
+            value_bytes = len(dumps(value)) + 1
+            if batch_bytes + value_bytes > self._LOKI_MAX_PUSH_BYTES and index > batch_start:
+                yield values[batch_start:index]
+                batch_start, batch_bytes = index, 1
+            batch_bytes += value_bytes
+        if batch_start < len(values):
+            yield values[batch_start:]
+
+    def build_payload(self,
+                      data: list[dict[str, str | int]] | dict[str, str | int]
+                      ) -> tuple[dict[str, Any], list[list[str]]]:
         """Examples of curl post request for pushing logs to loki:
         https://grafana.com/docs/loki/latest/reference/loki-http-api/#examples
 
@@ -140,26 +214,20 @@ class MetricWorkerProcess(Process):
         will additional have `fields` as labels (provided by `labels.update(data)` code below)
 
         :param data: list of dicts or dict with rows data within (see `push_logs_to_loki` for examples)
-        :return: special dictionary (data-raw in example above) for post request body
+        :return: labels (`stream`) and `values` of the stream for post request body (data-raw in example above)
         """
-        labels: dict[str, Any] = {"timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                                  "job": self.metric_name,
-                                  "response_time": self.metric_timeout}
+        labels: dict[str, Any] = {"timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), **self.stream_labels}
 
+        # All rows were fetched by one query, so they share one timestamp
+        timestamp_ns = str(time_ns())
         if isinstance(data, dict):
             labels.update(data)
-            values = [[str(int(time() * 1e9)), json.dumps(data)]]
+            values = [[timestamp_ns, orjson.dumps(data).decode()]]
         else:
-            values = []
-            for row in data:
-                value = [str(int(time() * 1e9)), json.dumps(row)]
-                values.append(value)
+            dumps = orjson.dumps  # bound once - it's called for every row
+            values = [[timestamp_ns, dumps(row).decode()] for row in data]
 
-        stream = {
-            "stream": labels,
-            "values": values,
-        }
-        return {"streams": [stream]}
+        return labels, values
 
     def count_metric_timeout(self, execution_time: float) -> float:
         """We need to count the rest of timeout, because we needn't wait full time.
@@ -204,7 +272,11 @@ class MetricWorkerProcess(Process):
         |  timeout  |####|####|####|####|####|####|####|####|####|####|####|####|
                     ╰──1 timeout───╯╰──2 timeout──╯╰──3 timeout──╯╰──4 timeout──╯
 
-        :param execution_time: time sqream took to execute metric, seconds
+        Worker passes the whole cycle time here (sqream execution, Loki push and oversleep of previous `sleep`),
+        so the cycle together with returned timeout always ends on the metric frequency grid.
+        Result isn't rounded: rounding would shift every next cycle a bit and accumulate into drift
+
+        :param execution_time: time the whole metric cycle took, seconds
         :return: actual time, how many seconds process need to wait
         """
         if execution_time > self.metric_timeout:
@@ -220,4 +292,16 @@ class MetricWorkerProcess(Process):
         else:
             # Otherwise just make a deduction, like: 15 (timeout) - 8 (execution time) = 7 result time to wait
             timeout = self.metric_timeout - execution_time
-        return round(timeout, 2)
+        return timeout
+
+    def count_skipped_cycles(self, cycle_time: float) -> int:
+        """Count scheduled cycles which were skipped because metric cycle took longer than metric timeout.
+        For example, with 10 seconds of timeout cycle which took 25 seconds skips cycles scheduled on 10 and 20 seconds,
+        and the next one starts on 30 seconds (see `count_metric_timeout`)
+
+        :param cycle_time: time the whole metric cycle took, seconds
+        :return: number of skipped cycles, 0 if cycle fits into metric timeout
+        """
+        if cycle_time <= self.metric_timeout:
+            return 0
+        return int(cycle_time // self.metric_timeout)
@@ -1,12 +1,12 @@
 from __future__ import annotations
 
-import json
 import signal
 from multiprocessing import Event
 from time import sleep
 from pathlib import Path
 
-import requests
+import orjson
+import urllib3
 from loguru import logger as log
 
 from infra.sqream_connection import SqreamConnection
@@ -14,6 +14,19 @@ from infra.metric_worker import MetricWorkerProcess
 from infra.utils import terminate_metric_processes
 
 
+# Here we need to get absolute path of `monitor_input.json`
+# regardless of directory from which we start `main.py`
+
+# For example, if we run `python main.py` from /home/sqreamdb-monitor-service with os.getcwd(),
+# we will get path like `/home/sqreamdb-monitor-service/monitor_input.json`
+# Or if we do the same command but from `/home` directory,
+# we will get = `/home/monitor_input.json` which is wrong
+
+# for that reason we can not use `os.getcwd()` here and use `Path('monitor.py').parent.parent`
+# to make it `reverse-relative`. It's computed once on import
+_DEFAULT_METRICS_PATH = Path(__file__).parent.parent / "monitor_input.json"
+
+
 class MonitorService:
     _ALLOWED_METRICS = {
         "show_server_status": {"send_to_loki": True},
@@ -23,6 +36,7 @@ class MonitorService:
         "get_license_info": {"send_to_loki": True},
         "reset_leveldb_stats": {"send_to_loki": False},
     }
+    _METRICS_SENT_TO_LOKI = frozenset(name for name, options in _ALLOWED_METRICS.items() if options["send_to_loki"])
 
     def __init__(self,
                  host: str,
@@ -34,7 +48,8 @@ class MonitorService:
                  service: str,
                  loki_host: str,
                  loki_port: int,
-                 log_file_path: str):
+                 log_file_path: str,
+                 verbose: bool):
         self.host: str = host
         self.port: int = port
         self.username: str = username
@@ -44,7 +59,9 @@ class MonitorService:
         self.service: str = service
         self.loki_host: str = loki_host
         self.loki_port: int = loki_port
+        self.loki_address: str = f"http://{loki_host}:{loki_port}"
         self.log_file_path: str = log_file_path
+        self.verbose: bool = verbose
 
         self.workers: list[MetricWorkerProcess] = []
         self.stop_event: Event = Event()
@@ -57,18 +74,21 @@ class MonitorService:
                                                                     clustered=self.clustered,
                                                                     service=self.service)
         # Check sqream is working on CPU and not on GPU
-        self.check_sqream_on_cpu()
+        try:
+            self.check_sqream_on_cpu()
+        finally:
+            # Every worker opens its own connection, so this one mustn't stay idle while service is running
+            self.sqream_connection.close()
         # Check Loki's connection is established
         self.check_loki_connection()
 
     def check_customer_metrics(self, customer_metrics: dict[str, int]) -> None:
         """Check all metrics provided by customer in the `monitor_input.json` are known and values are valid"""
-        for customer_metric in customer_metrics:
+        for customer_metric, metric_timeout in customer_metrics.items():
             if customer_metric not in self._ALLOWED_METRICS:
                 raise NameError(f"Metric `{customer_metric}` from `monitor_input.json` isn't allowed. "
                                 f"Allowed metrics: {self._ALLOWED_METRICS}")
             # try to convert value to float for make sure customer provide it correctly
-            metric_timeout = customer_metrics[customer_metric]
             try:
                 float(metric_timeout)
             except ValueError:
@@ -79,22 +99,8 @@ class MonitorService:
         log.success("All metrics are validated and allowed")
 
     def get_customer_metrics(self, metrics_json_path: str | None = None) -> dict[str, int]:
-        if metrics_json_path is None:
-            # Here we need to get absolute path of `monitor_input.json`
-            # regardless of directory from which we start `main.py`
-
-            # For example, if we run `python main.py` from /home/sqreamdb-monitor-service with os.getcwd(),
-            # we will get path like `/home/sqreamdb-monitor-service/monitor_input.json`
-            # Or if we do the same command but from `/home` directory,
-            # we will get = `/home/monitor_input.json` which is wrong
-
-            # for that reason we can not use `os.getcwd()` here and use `Path('utils.py').parent.parent`
-            # to make it `reverse-relative`
-            metrics_json_path = Path(__file__).parent.parent / "monitor_input.json"
-
-        with open(metrics_json_path) as json_file:
-            metrics = json.load(json_file)
-
+        metrics_json_path = _DEFAULT_METRICS_PATH if metrics_json_path is None else Path(metrics_json_path)
+        metrics = orjson.loads(metrics_json_path.read_bytes())
         self.check_customer_metrics(metrics)
         return metrics
 
@@ -116,10 +122,18 @@ class MonitorService:
         without affecting data
         :return: None
         """
-        response = requests.get(f"http://{self.loki_host}:{self.loki_port}/metrics")
-        msg = (f"Request `curl -X GET http://{self.loki_host}:{self.loki_port}/metrics` "
-               f"returns status_code = {response.status_code}")
-        if response.status_code != 200:
+        # `preload_content=False` - we need only status code, so `/metrics` body (could be megabytes) isn't downloaded
+        # `timeout` - unreachable Loki shouldn't hang startup forever
+        # Pool is closed right away, so its socket isn't inherited by metric processes
+        with urllib3.PoolManager() as http:
+            response = http.request("GET", f"{self.loki_address}/metrics", preload_content=False,
+                                    timeout=urllib3.Timeout(connect=2, read=5), retries=False)
+            status_code = response.status
+            # Body wasn't read, so connection can't be reused - close it instead of returning to the pool
+            response.close()
+        msg = (f"Request `curl -X GET {self.loki_address}/metrics` "
+               f"returns status_code = {status_code}")
+        if status_code != 200:
             raise ValueError(msg)
         log.success("Loki connection established successfully.")
 
@@ -149,6 +163,6 @@ class MonitorService:
                                          stop_event=self.stop_event, host=self.host, port=self.port,
                                          username=self.username, password=self.password,
                                          database=self.database, service=self.service, clustered=self.clustered,
-                                         send_to_loki=self._ALLOWED_METRICS[metric_name]["send_to_loki"],
-                                         loki_url=f"http://{self.loki_host}:{self.loki_port}/loki/api/v1/push")
+                                         send_to_loki=metric_name in self._METRICS_SENT_TO_LOKI,
+                                         loki_url=f"{self.loki_address}/loki/api/v1/push")
             self.workers.append(worker)
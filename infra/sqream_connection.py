@@ -4,6 +4,7 @@ from typing import Literal
 
 import pysqream
 from pysqream.connection import Connection
+from pysqream.cursor import Cursor
 
 from infra.utils import timeit
 
@@ -11,24 +12,19 @@ from infra.utils import timeit
 class SqreamConnection:
     """Representation of sqream connection class."""
 
-    host: str | None = None
-    port: int | None = None
-    username: str | None = None
-    password: str | None = None
-    database: str | None = None
-    clustered: bool | None = None
-    service: str | None = None
-    connection: Connection | None = None
+    __slots__ = ("connection", "cursor")
 
     def __init__(self, host: str, port: int, database: str, username: str, password: str, clustered: bool, service: str):
-        if self.connection is None:
-            self.connection = pysqream.connect(host=host, port=port, database=database, username=username,
-                                               password=password, clustered=clustered, service=service)
+        self.connection: Connection = pysqream.connect(host=host, port=port, database=database, username=username,
+                                                       password=password, clustered=clustered, service=service)
+        # pysqream opens a new socket and logs in on every `connection.cursor()` call,
+        # so one cursor is opened lazily and reused for all queries
+        self.cursor: Cursor | None = None
 
     def execute(self,
                 query: str,
                 fetch: Literal["one", "all"] = "all"
-                ) -> tuple[list[dict[str, int | str]], float] | tuple[dict[str | int], float]:
+                ) -> tuple[list[dict[str, int | str]], float] | tuple[dict[str, int | str], float]:
         """:param query: sqream query to execute, e.g. `select show_locks()`
         :param fetch: possible way to get rows: `all` or `one`. Default - `all`
         :return: list of dicts (many rows) - for fetchall, dict (one row) - for fetchone
@@ -47,7 +43,7 @@ class SqreamConnection:
         ]
 
         3) For some strange reason `cursor.fetchone()` sometimes can return None.
-        Method will return empty list in that case
+        Method will return empty list in that case, as well as when query returned no rows
 
         Note:
         ----
@@ -61,23 +57,50 @@ class SqreamConnection:
 
         """
         with timeit() as elapsed_time:
-            with self.connection.cursor() as cursor:
+            if self.cursor is None:
+                self.cursor = self.connection.cursor()
+            cursor = self.cursor
+            try:
                 cursor.execute(query)
                 if fetch == "one":
                     result = cursor.fetchone()
                 else:
                     result = cursor.fetchall()
+            except Exception:
+                # Cursor state is unknown after failed query, so the next query will open a new one
+                self.close_cursor()
+                raise
 
-            if result is None:
+            # Nothing to convert - skip building column names too
+            if not result:
                 return [], elapsed_time()
 
+            # Column names are the same for every row, so fix them once per query and not once per row
+            col_names = [col_name.replace(" ", "_") for col_name in cursor.col_names]
+
             if fetch == "one":
-                return ({col_name.replace(" ", "_"): value for col_name, value in zip(cursor.col_names, result)},
-                        elapsed_time())
+                return dict(zip(col_names, result)), elapsed_time()
+
+            return [dict(zip(col_names, row)) for row in result], elapsed_time()
 
-            return [{col_name.replace(" ", "_"): value for col_name, value in zip(cursor.col_names, row)}
-                    for row in result], elapsed_time()
+    def close_cursor(self) -> None:
+        """Close the reused cursor (it has its own socket), if it was opened. Errors are ignored:
+        cursor is closed either after failed query or on shutdown, when it can't be used anyway
+        """
+        cursor, self.cursor = self.cursor, None
+        if cursor is not None and not cursor.closed:
+            try:
+                cursor.close()
+            except Exception:
+                pass
 
     def close(self) -> None:
+        """Close the cursor and the connection, if they are still open. Safe to call from `finally` blocks:
+        a socket which was already dropped by sqream is just left to the garbage collector
+        """
+        self.close_cursor()
         if self.connection is not None and not self.connection.con_closed:
-            self.connection.close_connection()
+            try:
+                self.connection.close_connection()
+            except OSError:
+                pass
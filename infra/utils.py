@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import argparse
+import sys
 from contextlib import contextmanager
 from multiprocessing import Process, Event
 from time import perf_counter
@@ -15,7 +16,7 @@ class SqreamUtilityFunctionTimeExceeded(Exception):
 
 def get_command_line_arguments() -> argparse.Namespace:
     """usage: main.py [-h --help] [--host] [--port] [--database] --username --password [--clustered] [--service]
-                      [--loki_host] [--loki_port] [--log_file_path]
+                      [--loki_host] [--loki_port] [--log_file_path] [--verbose]
 
     Command-line interface for monitor-service project
 
@@ -33,6 +34,7 @@ def get_command_line_arguments() -> argparse.Namespace:
       --loki_host           Loki remote address (default: `localhost`)
       --loki_port           Loki remote port (default: `3100`)
       --log_file_path       Path to file to store logs (default: `None`)
+      --verbose             Log every metric cycle: fetched rows, Loki pushes, timeouts (default: `False`)
 
     :return: argparse.Namespace with parsed arguments
     """
@@ -50,19 +52,31 @@ def get_command_line_arguments() -> argparse.Namespace:
     parser.add_argument("--loki_host", type=str, help="Loki remote address", default="127.0.0.1")
     parser.add_argument("--loki_port", type=int, help="Loki remote port", default="3100")
     parser.add_argument("--log_file_path", type=str, help="Name of file to store logs", default=None)
+    parser.add_argument("--verbose", action="store_true", help="Log every metric cycle")
 
     return parser.parse_args()
 
 
-def add_log_sink(log_file_path: str | None = None) -> None:
+def add_log_sink(log_file_path: str | None = None, verbose: bool = False) -> None:
     """Add loguru sink for store log lines if `log_file_path` was specified. More documentation here:
     https://loguru.readthedocs.io/en/stable/api/logger.html#loguru._logger.Logger.add
+
+    Metric workers log every cycle (fetched rows, Loki pushes, timeouts) with `DEBUG` level.
+    These lines are written only if `verbose` is True, otherwise sinks accept `INFO` and above. That's why
+    loguru default stderr sink (it accepts everything) is replaced with the one with chosen level
+
+    File sink isn't added with `enqueue=True`: its queue is guarded by a lock shared by all processes, and metric
+    process killed by `terminate()` while holding it would hang every next log line of main process
     :param log_file_path: string - path for logs file
+    :param verbose: bool - write `DEBUG` lines too
     :return: None
     """
+    level = "DEBUG" if verbose else "INFO"
+    log.remove()
+    log.add(sys.stderr, level=level)
     if log_file_path is not None:
         log.info(f"Logs also will be provided to {log_file_path}")
-        log.add(log_file_path)
+        log.add(log_file_path, level=level)
 
 
 @contextmanager
@@ -84,7 +98,6 @@ def terminate_metric_processes(*_, processes: list[Process] | None = None, stop_
     if stop_event is not None:
         stop_event.set()
     if processes is not None:
-        log.info(f"Killing all ({len(processes)}) processes")
         for process in processes:
             process.terminate()
-            log.info(f"Process `{process.name}` terminated successfully")
+        log.info(f"Terminated all ({len(processes)}) processes: {[process.name for process in processes]}")
@@ -0,0 +1,97 @@
+from multiprocessing import Event
+
+import orjson
+import pytest
+
+from infra.metric_worker import MetricWorkerProcess
+
+
+class StubLokiPool:
+    """Stands in for `urllib3.PoolManager`: remembers pushed bodies and accepts all of them"""
+
+    class Answer:
+        status = 204
+        data = b""
+
+    def __init__(self):
+        self.bodies: list[bytes] = []
+
+    def request(self, method: str, url: str, body: bytes, **_) -> Answer:
+        self.bodies.append(body)
+        return self.Answer()
+
+
+class TestMetricWorker:
+
+    @pytest.fixture()
+    def worker(self) -> MetricWorkerProcess:
+        # Sqream connection is opened only in `run`, so worker can be built without sqream
+        worker = MetricWorkerProcess(metric_name="show_locks", metric_timeout=10, send_to_loki=True,
+                                     host="localhost", port=5000, username="sqream", password="sqream",
+                                     database="master", clustered=False, service="monitor",
+                                     loki_url="http://localhost:3100/loki/api/v1/push", stop_event=Event())
+        worker.loki_pool = StubLokiPool()
+        return worker
+
+    @staticmethod
+    def pushed_rows(worker: MetricWorkerProcess) -> list[list[dict]]:
+        return [[orjson.loads(line) for _, line in orjson.loads(body)["streams"][0]["values"]]
+                for body in worker.loki_pool.bodies]
+
+    def test_push_logs_to_loki_one_batch(self, worker, monkeypatch):
+        # Body under the limit is sent as is, without measuring every value
+        monkeypatch.setattr(worker, "split_to_batches", None)
+        rows = [{"statement_id": i, "statement": "select 1"} for i in range(100)]
+        worker.push_logs_to_loki(data=rows)
+
+        assert self.pushed_rows(worker) == [rows]
+
+    def test_push_logs_to_loki_split_by_bytes(self, worker):
+        worker._LOKI_MAX_PUSH_BYTES = 64 * 1024
+        # Quotes are escaped in the body, so they must be counted in batch size too
+        rows = [{"statement_id": i, "statement": f"select '{i}', \"text\" from t" * 20} for i in range(2001)]
+        worker.push_logs_to_loki(data=rows)
+
+        batches = self.pushed_rows(worker)
+        assert len(batches) > 1
+        assert [row for batch in batches for row in batch] == rows, "Rows were lost or reordered"
+        for body in worker.loki_pool.bodies:
+            values_bytes = len(orjson.dumps(orjson.loads(body)["streams"][0]["values"]))
+            assert values_bytes <= worker._LOKI_MAX_PUSH_BYTES
+
+    def test_push_logs_to_loki_row_bigger_than_limit(self, worker):
+        worker._LOKI_MAX_PUSH_BYTES = 1024
+        rows = [{"statement": "a"}, {"statement": "b" * 2048}, {"statement": "c"}]
+        worker.push_logs_to_loki(data=rows)
+
+        assert self.pushed_rows(worker) == [[rows[0]], [rows[1]], [rows[2]]]
+
+    @pytest.mark.parametrize(
+        ("cycle_time", "expected_timeout", "expected_skipped_cycles"),
+        (
+            (0.0, 10.0, 0),
+            (2.5, 7.5, 0),
+            (10.0, 0.0, 0),
+            (12.0, 8.0, 1),
+            (20.0, 10.0, 2),
+            (38.0, 2.0, 3),
+        ),
+        ids=("instant", "below_timeout", "equal_timeout", "above_timeout", "multiple_of_timeout",
+             "few_timeouts"),
+    )
+    def test_count_metric_timeout(self, worker, cycle_time, expected_timeout, expected_skipped_cycles):
+        timeout = worker.count_metric_timeout(execution_time=cycle_time)
+
+        assert timeout == pytest.approx(expected_timeout)
+        assert worker.count_skipped_cycles(cycle_time=cycle_time) == expected_skipped_cycles
+        # Next cycle starts on the metric frequency grid, so cycles don't drift
+        next_cycle_start = cycle_time + timeout
+        assert next_cycle_start == pytest.approx((expected_skipped_cycles + 1) * worker.metric_timeout)
+
+    def test_count_metric_timeout_no_drift(self, worker):
+        # Deadline arithmetic from `run`: irregular cycle times must not shift the schedule
+        cycle_start = 0.0
+        for cycle_time in (0.3, 9.99, 4.2, 17.5, 0.01, 31.7, 10.0):
+            cycle_start += cycle_time + worker.count_metric_timeout(execution_time=cycle_time)
+        # 10 + 10 + 10 + 20 + 10 + 40 + 10
+        assert cycle_start == pytest.approx(110.0)
@@ -0,0 +1,36 @@
+import orjson
+import pytest
+
+from infra.monitor import MonitorService
+
+
+class TestMonitorService:
+
+    @pytest.fixture()
+    def monitor_service(self) -> MonitorService:
+        # `__init__` connects to sqream and Loki, metrics file loading doesn't need them
+        return MonitorService.__new__(MonitorService)
+
+    @pytest.fixture()
+    def validations(self, monitor_service, monkeypatch) -> list[dict]:
+        checked_metrics = []
+        check_customer_metrics = monitor_service.check_customer_metrics
+
+        def counting_check(customer_metrics):
+            checked_metrics.append(dict(customer_metrics))
+            check_customer_metrics(customer_metrics)
+
+        monkeypatch.setattr(monitor_service, "check_customer_metrics", counting_check)
+        return checked_metrics
+
+    def test_get_customer_metrics_validated(self, monitor_service, validations, tmp_path):
+        metrics_json = tmp_path / "monitor_input.json"
+        metrics_json.write_bytes(orjson.dumps({"show_locks": 5}))
+
+        assert monitor_service.get_customer_metrics(str(metrics_json)) == {"show_locks": 5}
+        assert validations == [{"show_locks": 5}]
+
+        metrics_json.write_bytes(orjson.dumps({"show_locks": 5, "get_license_info": 60}))
+
+        assert monitor_service.get_customer_metrics(str(metrics_json)) == {"show_locks": 5, "get_license_info": 60}
+        assert validations == [{"show_locks": 5}, {"show_locks": 5, "get_license_info": 60}]
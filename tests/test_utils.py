@@ -1,7 +1,8 @@
 import json
 import os
 import re
-from subprocess import call
+import sys
+from subprocess import call, run
 
 import pytest
 from loguru import logger as log
@@ -33,6 +34,49 @@ class TestUtils:
         finally:
             os.remove(test_log)
 
+    @pytest.mark.parametrize(("verbose", "debug_line_expected"), ((False, False), (True, True)),
+                             ids=("not_verbose", "verbose"))
+    def test_add_log_sink_verbose(self, verbose, debug_line_expected):
+        add_log_sink(self.temp_log_name, verbose=verbose)
+        log.debug("Metric cycle line")
+        log.info("Service line")
+
+        content = self.read_log_file_content(self.temp_log_name)
+        try:
+            assert "Service line" in content
+            assert ("Metric cycle line" in content) is debug_line_expected
+        finally:
+            log.remove()
+            os.remove(self.temp_log_name)
+
+    def test_terminate_metric_processes_with_file_sink(self):
+        # Workers are killed with `terminate()` while they are logging, so file sink mustn't leave any lock
+        # held by a killed process - otherwise the main process hangs on the next log line
+        script = (
+            "from multiprocessing import Process\n"
+            "from loguru import logger as log\n"
+            "from infra.utils import add_log_sink, terminate_metric_processes\n"
+            "def work():\n"
+            "    while True:\n"
+            "        log.info('Process interrupted by user. Stop all metrics')\n"
+            "if __name__ == '__main__':\n"
+            f"    add_log_sink({self.temp_log_name!r})\n"
+            "    for _ in range(20):\n"
+            "        processes = [Process(target=work) for _ in range(4)]\n"
+            "        for process in processes:\n"
+            "            process.start()\n"
+            "        terminate_metric_processes(processes=processes)\n"
+            "        for process in processes:\n"
+            "            process.join()\n"
+        )
+        try:
+            finished = run([sys.executable, "-c", script], capture_output=True, timeout=60)
+            assert finished.returncode == 0, f"script with workers exited with code {finished.returncode}"
+            content = self.read_log_file_content(self.temp_log_name)
+            assert content.count("Terminated all (4) processes") == 20, "Not every termination was logged"
+        finally:
+            os.remove(self.temp_log_name)
+
     def test_negative_no_monitor_input_json(self, monitor_input_json):
 
         os.rename(monitor_input_json, self.monitor_input_json_temp_name)
@@ -62,7 +106,7 @@ class TestUtils:
         content = self.read_log_file_content(self.temp_log_name)
 
         try:
-            assert re.search(r"ERROR.+Expecting value: line 1 column 1 \(char 0\)", content), (
+            assert re.search(r"ERROR.+line 1 column 1 \(char 0\)", content), (
                 "No ERROR line about `monitor_input.json` in logs"
             )
         finally: